@@ -8,15 +8,18 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price')
+    list_display = ('name', 'category', 'price', 'average_rating', 'review_count')
     list_editable = ('price',)
+    readonly_fields = ('average_rating', 'review_count')
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name', 'category__name')
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
-    list_display = ('user', 'content', 'created_at')
-    search_fields = ('user__username', 'content')
+    list_display = ('user', 'product', 'rating', 'content', 'created_at')
+    list_filter = ('rating',)
+    list_select_related = ('user', 'product')
+    search_fields = ('user__username', 'product__name', 'content')
 
 @admin.register(HomePoster)
 class HomePosterAdmin(admin.ModelAdmin):
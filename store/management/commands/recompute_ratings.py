@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute product review counts and average ratings from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', help='Only recompute products in this category slug')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['category']:
+            products = products.filter(category__slug=options['category'])
+        updated = Product.recompute_ratings(products)
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ratings for {updated} products'))
@@ -1,4 +1,13 @@
-from django.db import models
+import threading
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, QuerySet, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.db.models.lookups import GreaterThan
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib.auth.models import User
 
 class Category(models.Model):
@@ -17,9 +26,81 @@ class Product(models.Model):
     image = models.ImageField(upload_to='products/')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(blank=True)
+    # Denormalized review aggregates, kept in step with Review writes.
+    # Only adjust_rating/recompute_ratings write these; save() leaves them alone.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_total = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', '-average_rating'], name='product_cat_rating_idx'),
+        ]
+    
+    RATING_FIELDS = ('review_count', 'rating_total', 'average_rating')
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        if self.pk is None or self._state.adding:
+            # A new (or copied) product starts with no reviews
+            self.review_count = self.rating_total = 0
+            self.average_rating = 0
+        elif kwargs.get('update_fields') is None:
+            # Don't write back aggregates loaded earlier over concurrent review updates
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.RATING_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def _rating_updates(review_count, rating_total):
+        # average_rating goes first: MySQL evaluates SET clauses left to right
+        return {
+            'average_rating': Case(
+                When(
+                    GreaterThan(review_count, 0),
+                    then=Cast(rating_total, FloatField()) / review_count,
+                ),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+            'review_count': review_count,
+            'rating_total': rating_total,
+        }
+    
+    @classmethod
+    def adjust_rating(cls, product_id, count_delta, rating_delta):
+        """Apply a review delta to a product's aggregates without re-reading its reviews.
+
+        Counts are clamped at zero so drift (e.g. from bulk_create) never blocks a
+        delete; recompute_ratings repairs it.
+        """
+        cls.objects.filter(pk=product_id).update(**cls._rating_updates(
+            Greatest(F('review_count') + count_delta, 0),
+            Greatest(F('rating_total') + rating_delta, 0),
+        ))
+    
+    @classmethod
+    def recompute_ratings(cls, queryset=None):
+        """Rebuild review aggregates from the reviews table in bulk. Returns rows updated."""
+        if queryset is None:
+            queryset = cls.objects.all()
+        stats = (
+            Review.objects.filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(count=Count('pk'), total=Sum('rating'))
+        )
+        return queryset.update(**cls._rating_updates(
+            Coalesce(Subquery(stats.values('count')), Value(0)),
+            Coalesce(Subquery(stats.values('total')), Value(0)),
+        ))
 
 class CartItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -40,12 +121,97 @@ class ScrollingText(models.Model):
         return self.text[:50] + "..." if len(self.text) > 50 else self.text
 
 class Review(models.Model):
+    RATING_CHOICES = [(i, str(i)) for i in range(1, 6)]
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
+    rating = models.PositiveSmallIntegerField(
+        choices=RATING_CHOICES,
+        validators=[MinValueValidator(1), MaxValueValidator(5)],
+    )
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(rating__gte=1, rating__lte=5),
+                name='review_rating_range',
+            ),
+        ]
+    
     def __str__(self):
         return f"Review by {self.user.username}"
+    
+    # Product aggregates are maintained by save() and the delete receivers below.
+    # bulk_create() and queryset.update(rating=...) bypass both; run the
+    # recompute_ratings command afterwards.
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+        saves_product = update_fields is None or bool({'product', 'product_id'} & update_fields)
+        saves_rating = update_fields is None or 'rating' in update_fields
+        if not (saves_product or saves_rating):
+            return super().save(*args, **kwargs)
+        # Keep the product's aggregates in the same transaction as the review write
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = (
+                    Review.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values('product_id', 'rating')
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            if previous is None:
+                Product.adjust_rating(self.product_id, 1, self.rating)
+                return
+            product_id = self.product_id if saves_product else previous['product_id']
+            rating = self.rating if saves_rating else previous['rating']
+            if previous['product_id'] != product_id:
+                Product.adjust_rating(previous['product_id'], -1, -previous['rating'])
+                Product.adjust_rating(product_id, 1, rating)
+            elif previous['rating'] != rating:
+                Product.adjust_rating(product_id, 0, rating - previous['rating'])
+
+# Rating deltas for the delete in progress, per thread and database alias.
+# pre_delete fires for every collected review before any post_delete, so the
+# deltas are grouped by product and applied once the last review is gone,
+# still inside the delete transaction.
+_pending_review_deletes = threading.local()
+
+def _deletes_product(origin):
+    # The review's product is itself removed by the same operation
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model in (Product, Category)
+
+@receiver(pre_delete, sender=Review)
+def collect_review_rating(sender, instance, using, origin=None, **kwargs):
+    if _deletes_product(origin):
+        return
+    batch = getattr(_pending_review_deletes, using, None)
+    if batch is None or batch['origin'] is not origin or instance.pk in batch['pks']:
+        # Start afresh, discarding any batch left behind by a failed delete
+        batch = {'origin': origin, 'pks': set(), 'deltas': defaultdict(lambda: [0, 0])}
+        setattr(_pending_review_deletes, using, batch)
+    batch['pks'].add(instance.pk)
+    delta = batch['deltas'][instance.product_id]
+    delta[0] -= 1
+    delta[1] -= instance.rating
+
+@receiver(post_delete, sender=Review)
+def apply_review_rating(sender, instance, using, origin=None, **kwargs):
+    batch = getattr(_pending_review_deletes, using, None)
+    if batch is None or batch['origin'] is not origin:
+        return
+    batch['pks'].discard(instance.pk)
+    if batch['pks']:
+        return
+    delattr(_pending_review_deletes, using)
+    for product_id, (count_delta, rating_delta) in batch['deltas'].items():
+        Product.adjust_rating(product_id, count_delta, rating_delta)
 
 class HomePoster(models.Model):
     title = models.CharField(max_length=200, blank=True)
@@ -1,3 +1,206 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Category, Product, Review
+
+
+class ReviewAggregateTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.category = Category.objects.create(name='Seeds', slug='seeds')
+        self.other_category = Category.objects.create(name='Tools', slug='tools')
+        self.product = self.create_product('wheat')
+        self.other = self.create_product('rice')
+
+    def create_product(self, slug, category=None, price=10):
+        return Product.objects.create(
+            category=category or self.category,
+            name=slug.title(),
+            slug=slug,
+            image='products/test.jpg',
+            price=price,
+        )
+
+    def create_review(self, product, rating):
+        return Review.objects.create(user=self.user, product=product, rating=rating, content='Good')
+
+    def count_updates(self, queries):
+        return sum(q['sql'].startswith('UPDATE') for q in queries)
+
+    def assertAggregates(self, product, count, total, average):
+        product.refresh_from_db()
+        self.assertEqual(product.review_count, count)
+        self.assertEqual(product.rating_total, total)
+        self.assertAlmostEqual(product.average_rating, average)
+
+
+class ReviewAggregateMaintenanceTests(ReviewAggregateTestCase):
+    def test_create_updates_aggregates(self):
+        self.create_review(self.product, 5)
+        self.create_review(self.product, 2)
+        self.assertAggregates(self.product, 2, 7, 3.5)
+        self.assertAggregates(self.other, 0, 0, 0)
+
+    def test_rating_change_updates_aggregates(self):
+        self.create_review(self.product, 5)
+        review = self.create_review(self.product, 2)
+        review.rating = 4
+        review.save()
+        self.assertAggregates(self.product, 2, 9, 4.5)
+
+    def test_moving_review_updates_both_products(self):
+        self.create_review(self.product, 5)
+        review = self.create_review(self.product, 2)
+        review.product = self.other
+        review.rating = 3
+        review.save()
+        self.assertAggregates(self.product, 1, 5, 5)
+        self.assertAggregates(self.other, 1, 3, 3)
+
+    def test_save_without_rating_in_update_fields(self):
+        review = self.create_review(self.product, 5)
+        review.rating = 1
+        review.content = 'Changed'
+        review.save(update_fields=['content'])
+        self.assertAggregates(self.product, 1, 5, 5)
+
+    def test_save_with_rating_in_update_fields(self):
+        review = self.create_review(self.product, 5)
+        review.rating = 1
+        review.product = self.other
+        review.save(update_fields=['rating'])
+        self.assertAggregates(self.product, 1, 1, 1)
+        self.assertAggregates(self.other, 0, 0, 0)
+
+    def test_rating_out_of_range_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_review(self.product, 9)
+        self.assertAggregates(self.product, 0, 0, 0)
+
+    def test_delete_updates_aggregates(self):
+        review = self.create_review(self.product, 5)
+        self.create_review(self.product, 2)
+        review.delete()
+        self.assertAggregates(self.product, 1, 2, 2)
+
+    def test_queryset_delete_updates_aggregates(self):
+        self.create_review(self.product, 5)
+        self.create_review(self.product, 2)
+        self.create_review(self.other, 4)
+        Review.objects.filter(product=self.product).delete()
+        self.assertAggregates(self.product, 0, 0, 0)
+        self.assertAggregates(self.other, 1, 4, 4)
+
+    def test_queryset_delete_updates_once_per_product(self):
+        for rating in (5, 2, 3):
+            self.create_review(self.product, rating)
+        self.create_review(self.other, 4)
+        self.create_review(self.other, 1)
+        with CaptureQueriesContext(connection) as queries:
+            Review.objects.all().delete()
+        self.assertEqual(self.count_updates(queries), 2)
+        self.assertAggregates(self.product, 0, 0, 0)
+        self.assertAggregates(self.other, 0, 0, 0)
+
+    def test_user_delete_updates_once_per_product(self):
+        self.create_review(self.product, 5)
+        self.create_review(self.product, 3)
+        self.create_review(self.other, 2)
+        reviewer = User.objects.create_user(username='grower', password='secret')
+        Review.objects.create(user=reviewer, product=self.product, rating=1, content='Meh')
+        with CaptureQueriesContext(connection) as queries:
+            self.user.delete()
+        self.assertEqual(self.count_updates(queries), 2)
+        self.assertAggregates(self.product, 1, 1, 1)
+        self.assertAggregates(self.other, 0, 0, 0)
+
+    def test_stale_product_save_keeps_aggregates(self):
+        self.create_review(self.product, 4)
+        stale = Product.objects.get(pk=self.product.pk)
+        self.create_review(self.product, 1)
+        stale.price = 20
+        stale.save()
+        self.assertAggregates(self.product, 2, 5, 2.5)
+        self.assertEqual(self.product.price, 20)
+
+    def test_copied_product_starts_without_reviews(self):
+        self.create_review(self.product, 4)
+        copy = Product.objects.get(pk=self.product.pk)
+        copy.pk = None
+        copy.slug = 'wheat-copy'
+        copy.save()
+        self.assertNotEqual(copy.pk, self.product.pk)
+        self.assertAggregates(copy, 0, 0, 0)
+        self.assertAggregates(self.product, 1, 4, 4)
+
+    def test_deferred_product_save_only_updates_loaded_fields(self):
+        self.create_review(self.product, 4)
+        product = Product.objects.only('price').get(pk=self.product.pk)
+        product.price = 15
+        with self.assertNumQueries(1):
+            product.save()
+        self.assertAggregates(self.product, 1, 4, 4)
+        self.assertEqual(self.product.price, 15)
+        self.assertEqual(self.product.name, 'Wheat')
+
+    def test_delete_after_drift_clamps_at_zero(self):
+        Review.objects.bulk_create([
+            Review(user=self.user, product=self.product, rating=5, content='Bulk'),
+        ])
+        Review.objects.all().delete()
+        self.assertAggregates(self.product, 0, 0, 0)
+
+    def test_product_delete_skips_adjustment(self):
+        for rating in (1, 2, 3):
+            self.create_review(self.product, rating)
+        with CaptureQueriesContext(connection) as queries:
+            self.product.delete()
+        self.assertEqual(self.count_updates(queries), 0)
+        self.assertFalse(Review.objects.exists())
+
+
+class RecomputeRatingsCommandTests(ReviewAggregateTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tool = self.create_product('hoe', category=self.other_category)
+        self.create_review(self.product, 5)
+        self.create_review(self.product, 2)
+        self.create_review(self.tool, 3)
+        Product.objects.update(review_count=9, rating_total=1, average_rating=4)
+
+    def test_recompute_repairs_all_products(self):
+        out = StringIO()
+        call_command('recompute_ratings', stdout=out)
+        self.assertIn('Recomputed ratings for 3 products', out.getvalue())
+        self.assertAggregates(self.product, 2, 7, 3.5)
+        self.assertAggregates(self.other, 0, 0, 0)
+        self.assertAggregates(self.tool, 1, 3, 3)
+
+    def test_recompute_is_single_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            Product.recompute_ratings()
+        self.assertEqual(self.count_updates(queries), 1)
+        self.assertAggregates(self.product, 2, 7, 3.5)
+
+    def test_recompute_limited_to_category(self):
+        call_command('recompute_ratings', category='tools', stdout=StringIO())
+        self.assertAggregates(self.tool, 1, 3, 3)
+        self.assertAggregates(self.product, 9, 1, 4)
+
 
-# Create your tests here.
+class CategoryProductsViewTests(ReviewAggregateTestCase):
+    def test_sort_by_rating(self):
+        best = self.create_product('barley')
+        self.create_review(self.product, 3)
+        self.create_review(best, 5)
+        response = self.client.get(
+            reverse('category_products', args=[self.category.slug]), {'sort': 'rating'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [best, self.product, self.other])
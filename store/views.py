@@ -14,7 +14,7 @@ from django.views.decorators.csrf import csrf_exempt
 def home(request):
     categories = Category.objects.all()
     products = Product.objects.all()[:8]  # Show only 8 products on home
-    reviews = Review.objects.all().order_by('-created_at')[:5]
+    reviews = Review.objects.select_related('user', 'product').order_by('-created_at')[:5]
     posters = HomePoster.objects.filter(is_active=True)
     return render(request, 'store/home.html', {
         'categories': categories,
@@ -120,12 +120,24 @@ def contact(request):
     
     return render(request, 'store/contact.html', {'form': form})
 
+# Sort options for category listings; rating sorts read the denormalized product aggregates
+PRODUCT_SORTS = {
+    'rating': ('-average_rating', '-review_count'),
+    'price_asc': ('price',),
+    'price_desc': ('-price',),
+    'newest': ('-id',),
+}
+
 def category_products(request, category_slug):
     category = get_object_or_404(Category, slug=category_slug)
+    sort = request.GET.get('sort', '')
     products = Product.objects.filter(category=category)
+    if sort in PRODUCT_SORTS:
+        products = products.order_by(*PRODUCT_SORTS[sort])
     return render(request, 'store/category_products.html', {
         'category': category,
-        'products': products
+        'products': products,
+        'sort': sort
     })
 
 # Initialize Razorpay client